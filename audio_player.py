@@ -2,13 +2,17 @@
 音频播放模块 - 支持不同事件类型的音频提醒
 """
 import asyncio
+import io
 import os
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 from dynaconf import Dynaconf
 
+from tracing import Trace, span
+
 # Windows 音频播放支持
 try:
     import winsound
@@ -33,7 +37,8 @@ class AudioPlayer:
         self.config = config
         self.sounds_base_path = Path(config.sounds.base_path)
         self.sound_files = config.sounds.files
-        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="audio")
+        # pygame.mixer.music 只有一个播放通道，单线程执行以保证各次播放依次进行、互不打断
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio")
         
         # 确保音频目录存在
         self.sounds_base_path.mkdir(exist_ok=True)
@@ -56,16 +61,29 @@ class AudioPlayer:
             
         return sound_path
     
-    def _play_sound_sync(self, sound_path: Path) -> bool:
-        """同步播放音频文件"""
+    def _play_sound_sync(
+        self,
+        sound_path: Path,
+        trace: Optional[Trace] = None,
+        submitted: Optional[float] = None,
+        on_start: Optional[Callable[[float], None]] = None
+    ) -> bool:
+        """同步播放音频文件，开始播放时以 perf_counter 时间戳回调 on_start"""
+        if trace is not None and submitted is not None:
+            trace.add_span("executor_wait", submitted, time.perf_counter())
         try:
             if PYGAME_AVAILABLE:
                 # 使用 pygame 播放音频
-                pygame.mixer.music.load(str(sound_path))
-                pygame.mixer.music.play()
+                with span(trace, "mixer_load"):
+                    pygame.mixer.music.load(str(sound_path))
+                with span(trace, "mixer_start"):
+                    pygame.mixer.music.play()
+                if on_start is not None:
+                    on_start(time.perf_counter())
                 # 等待播放完成
-                while pygame.mixer.music.get_busy():
-                    pygame.time.wait(100)
+                with span(trace, "playback"):
+                    while pygame.mixer.music.get_busy():
+                        pygame.time.wait(100)
                 logger.debug(f"使用 pygame 播放音频: {sound_path}")
                 return True
             else:
@@ -75,9 +93,15 @@ class AudioPlayer:
             logger.error(f"播放音频失败: {sound_path}, 错误: {e}")
             return False
     
-    async def play_sound_async(self, event_type: str) -> bool:
+    async def play_sound_async(
+        self,
+        event_type: str,
+        trace: Optional[Trace] = None,
+        on_start: Optional[Callable[[float], None]] = None
+    ) -> bool:
         """异步播放指定事件类型的音频"""
-        sound_path = self._get_sound_file_path(event_type)
+        with span(trace, "resolve_sound"):
+            sound_path = self._get_sound_file_path(event_type)
         if not sound_path:
             return False
         
@@ -87,7 +111,10 @@ class AudioPlayer:
             success = await loop.run_in_executor(
                 self.executor, 
                 self._play_sound_sync, 
-                sound_path
+                sound_path,
+                trace,
+                time.perf_counter(),
+                on_start
             )
             
             if success:
@@ -100,6 +127,37 @@ class AudioPlayer:
             logger.error(f"异步播放音频失败: {event_type}, 错误: {e}")
             return False
     
+    def _play_bytes_sync(self, data: bytes, namehint: str = "wav") -> bool:
+        """同步播放内存中的音频数据"""
+        try:
+            if PYGAME_AVAILABLE:
+                pygame.mixer.music.load(io.BytesIO(data), namehint)
+                pygame.mixer.music.play()
+                while pygame.mixer.music.get_busy():
+                    pygame.time.wait(100)
+                logger.debug(f"使用 pygame 播放内存音频: {len(data)} 字节")
+                return True
+            else:
+                logger.error("pygame 不可用，无法播放音频")
+                return False
+        except Exception as e:
+            logger.error(f"播放内存音频失败, 错误: {e}")
+            return False
+    
+    async def play_bytes_async(self, data: bytes, namehint: str = "wav") -> bool:
+        """异步播放内存中的音频数据 (与文件播放共用同一单线程池，依次播放)"""
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self.executor,
+                self._play_bytes_sync,
+                data,
+                namehint
+            )
+        except Exception as e:
+            logger.error(f"异步播放内存音频失败, 错误: {e}")
+            return False
+    
     def play_sound(self, event_type: str) -> bool:
         """同步播放指定事件类型的音频"""
         sound_path = self._get_sound_file_path(event_type)
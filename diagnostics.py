@@ -0,0 +1,397 @@
+"""
+服务自诊断模块
+并发执行连通性、端口、往返延迟和音频设备检查，并在限定时间内汇总为一份结构化报告
+既可以作为服务内的 /diagnostics API 使用，也可以作为命令行工具运行: python diagnostics.py
+"""
+import argparse
+import asyncio
+import json
+import math
+import socket
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from dynaconf import Dynaconf
+from pydantic import BaseModel, Field
+
+from security import Credentials
+
+if TYPE_CHECKING:
+    from audio_player import AudioPlayer
+
+
+DEFAULT_TIMEOUT = 10.0
+LATENCY_SAMPLES = 5
+
+# 往返测试事件在 payload 中的标记字段，服务据此在开始播放时报告探测结果
+PROBE_FIELD = "diagnostics_probe"
+# 等待探测结果的最长时间 (秒)
+PROBE_WAIT_MAX = 60.0
+
+
+class ProbeRegistry:
+    """
+    往返测试探测结果登记表 (只在事件循环中访问)
+    测试事件开始播放 (或播放失败) 时写入结果，诊断请求等待并取走结果，两者的先后顺序不确定
+    """
+
+    def __init__(self, max_pending: int = 64):
+        self.max_pending = max_pending
+        self._futures: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+
+    def _future(self, probe_id: str) -> asyncio.Future:
+        future = self._futures.get(probe_id)
+        if future is None:
+            if len(self._futures) >= self.max_pending:
+                # 登记表已满时丢弃最早的探测，其等待方会超时
+                self._futures.popitem(last=False)
+            future = self._futures[probe_id] = asyncio.get_running_loop().create_future()
+        return future
+
+    def resolve(self, probe_id: str, result: Dict[str, Any]):
+        """写入探测结果，重复写入时保留第一次的结果"""
+        future = self._future(probe_id)
+        if not future.done():
+            future.set_result(result)
+
+    async def wait(self, probe_id: str, timeout: float) -> Dict[str, Any]:
+        """等待探测结果，超时抛出 asyncio.TimeoutError"""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._future(probe_id)), timeout=timeout)
+        finally:
+            self._futures.pop(probe_id, None)
+
+
+class CheckResult(BaseModel):
+    """单项检查结果"""
+    name: str = Field(..., description="检查项名称")
+    success: bool = Field(..., description="检查是否通过")
+    duration_ms: float = Field(..., description="检查耗时 (毫秒)")
+    details: Dict[str, Any] = Field(default_factory=dict, description="检查详情")
+    error: Optional[str] = Field(default=None, description="失败原因")
+
+
+class DiagnosticsReport(BaseModel):
+    """诊断报告"""
+    success: bool = Field(..., description="所有检查是否通过")
+    target: str = Field(..., description="被诊断的服务地址")
+    duration_ms: float = Field(..., description="诊断总耗时 (毫秒)")
+    checks: List[CheckResult] = Field(..., description="各项检查结果")
+
+
+def get_local_ip() -> Optional[str]:
+    """获取本机局域网 IP 地址 (UDP connect 不会实际发送数据)"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            return s.getsockname()[0]
+    except OSError:
+        return None
+
+
+async def http_request(
+    host: str,
+    port: int,
+    method: str,
+    path: str,
+    timeout: float,
+    credentials: Optional[Credentials] = None,
+    json_body: Optional[Dict[str, Any]] = None
+) -> Tuple[int, Any]:
+    """发送一个最小化的 HTTP/1.1 请求，返回状态码和 (尽量解析为 JSON 的) 响应体"""
+    content = json.dumps(json_body).encode("utf-8") if json_body is not None else b""
+    headers = {"Content-Type": "application/json"} if json_body is not None else {}
+    if credentials:
+        headers.update(credentials.headers(method, path, content))
+    extra_headers = "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+
+    async def _request():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {host}:{port}\r\n"
+                "Accept: application/json\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                f"{extra_headers}"
+                "Connection: close\r\n\r\n".encode("ascii") + content
+            )
+            await writer.drain()
+            raw = await reader.read()
+        finally:
+            writer.close()
+        return raw
+
+    raw = await asyncio.wait_for(_request(), timeout=timeout)
+    head, _, body = raw.partition(b"\r\n\r\n")
+    status_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+    status = int(status_line.split(" ", 2)[1])
+    try:
+        return status, json.loads(body)
+    except ValueError:
+        return status, body.decode("utf-8", errors="replace")
+
+
+async def check_reachability(host: str, port: int) -> Dict[str, Any]:
+    """
+    检查目标主机是否可达: 解析地址后向其发起 TCP 连接
+    连接被接受或被拒绝 (RST) 都说明主机可达，因此不依赖服务端口是否开放；
+    只有网络不可达或无响应 (主机离线、防火墙丢弃) 时判定失败
+    """
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    address = infos[0][4][0]
+
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.open_connection(address, port)
+        writer.close()
+        port_open = True
+    except ConnectionRefusedError:
+        port_open = False
+    rtt_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "host": host,
+        "addresses": sorted({info[4][0] for info in infos}),
+        "address": address,
+        "rtt_ms": round(rtt_ms, 2),
+        "port_open": port_open,
+        "local_ip": await loop.run_in_executor(None, get_local_ip)
+    }
+
+
+async def check_port(host: str, port: int) -> Dict[str, Any]:
+    """检查服务端口是否可以建立 TCP 连接"""
+    start = time.perf_counter()
+    _, writer = await asyncio.open_connection(host, port)
+    connect_ms = (time.perf_counter() - start) * 1000
+    writer.close()
+    return {"port": port, "connect_ms": round(connect_ms, 2)}
+
+
+async def check_latency(host: str, port: int, samples: int, timeout: float) -> Dict[str, Any]:
+    """测量 /health 接口的 HTTP 往返延迟"""
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        status, _ = await http_request(host, port, "GET", "/health", timeout)
+        if status != 200:
+            raise RuntimeError(f"/health 返回状态码 {status}")
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    return {
+        "samples": samples,
+        "min_ms": round(latencies[0], 2),
+        "median_ms": round(latencies[len(latencies) // 2], 2),
+        "max_ms": round(latencies[-1], 2)
+    }
+
+
+def make_probe_event(probe_id: str) -> Dict[str, Any]:
+    """构造带探测标记的测试事件，与真实 Hook 事件经过相同的处理路径"""
+    return {
+        "event_type": "notification",
+        "source": "diagnostics",
+        "payload": {PROBE_FIELD: probe_id}
+    }
+
+
+async def check_roundtrip(
+    host: str,
+    port: int,
+    timeout: float,
+    credentials: Optional[Credentials] = None
+) -> Dict[str, Any]:
+    """
+    通过 /notify/hook 发送一个带标记的测试事件 (完整经过请求解析、后台任务和音频文件加载播放)，
+    再通过 /diagnostics/roundtrip/{probe_id} 等待服务报告播放开始，测量从发送事件到开始播放的时间
+    """
+    probe_id = uuid.uuid4().hex
+    start = time.perf_counter()
+    status, body = await http_request(
+        host, port, "POST", "/notify/hook", timeout, credentials, json_body=make_probe_event(probe_id)
+    )
+    hook_ms = (time.perf_counter() - start) * 1000
+    if status != 200:
+        raise RuntimeError(f"测试事件发送失败 (状态码 {status}): {body}")
+
+    wait = min(timeout, PROBE_WAIT_MAX)
+    status, body = await http_request(
+        host, port, "GET", f"/diagnostics/roundtrip/{probe_id}?timeout={wait}", timeout, credentials
+    )
+    total_ms = (time.perf_counter() - start) * 1000
+    if status != 200 or not isinstance(body, dict) or not body.get("success"):
+        raise RuntimeError(f"测试事件播放失败 (状态码 {status}): {body}")
+
+    return {
+        "hook_response_ms": round(hook_ms, 2),
+        "playback_start_ms": body.get("latency_ms"),
+        "total_ms": round(total_ms, 2)
+    }
+
+
+async def check_remote_audio(
+    host: str,
+    port: int,
+    timeout: float,
+    credentials: Optional[Credentials] = None
+) -> Dict[str, Any]:
+    """通过 /diagnostics/audio 获取服务端的音频设备状态"""
+    status, body = await http_request(host, port, "GET", "/diagnostics/audio", timeout, credentials)
+    if status != 200 or not isinstance(body, dict):
+        raise RuntimeError(f"/diagnostics/audio 返回状态码 {status}")
+    if not body.get("success"):
+        raise RuntimeError(body.get("error") or "音频设备不可用")
+    return body.get("details", {})
+
+
+async def check_audio_device(audio_player: "AudioPlayer") -> Dict[str, Any]:
+    """检查本进程的音频输出设备和音频文件"""
+    from audio_player import PYGAME_AVAILABLE
+
+    if not PYGAME_AVAILABLE:
+        raise RuntimeError("pygame 不可用")
+
+    import pygame
+    mixer_init = pygame.mixer.get_init()
+    if not mixer_init:
+        raise RuntimeError("pygame.mixer 未初始化，可能没有可用的音频输出设备")
+
+    missing = sorted(
+        name for name, file in dict(audio_player.sound_files).items()
+        if not (audio_player.sounds_base_path / file).exists()
+    )
+    if missing:
+        raise RuntimeError(f"音频文件缺失: {', '.join(missing)}")
+
+    frequency, size, channels = mixer_init
+    return {
+        "frequency": frequency,
+        "size": size,
+        "channels": channels,
+        "sound_files": len(audio_player.sound_files)
+    }
+
+
+async def _run_check(name: str, check: Awaitable[Dict[str, Any]], deadline: float) -> CheckResult:
+    """执行单项检查，超出整体截止时间时记为失败"""
+    start = time.perf_counter()
+    try:
+        details = await asyncio.wait_for(check, timeout=max(deadline - time.monotonic(), 0))
+        success, error = True, None
+    except asyncio.TimeoutError:
+        details, success, error = {}, False, "检查超时"
+    except Exception as e:
+        details, success, error = {}, False, f"{type(e).__name__}: {e}"
+
+    return CheckResult(
+        name=name,
+        success=success,
+        duration_ms=round((time.perf_counter() - start) * 1000, 2),
+        details=details,
+        error=error
+    )
+
+
+async def run_diagnostics(
+    host: str,
+    port: int,
+    audio_player: Optional["AudioPlayer"] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    samples: int = LATENCY_SAMPLES,
+    credentials: Optional[Credentials] = None
+) -> DiagnosticsReport:
+    """
+    并发执行所有诊断检查
+    传入 audio_player 时在本进程内检查音频设备，否则通过服务接口获取远端的音频设备状态
+    服务启用接入认证时，需要通过 credentials 为受保护的诊断接口生成认证头
+    """
+    if not math.isfinite(timeout) or timeout <= 0:
+        raise ValueError(f"无效的诊断超时: {timeout}")
+
+    start = time.perf_counter()
+    deadline = time.monotonic() + timeout
+
+    checks = {
+        "reachability": check_reachability(host, port),
+        "port": check_port(host, port),
+        "latency": check_latency(host, port, samples, timeout),
+        "roundtrip": check_roundtrip(host, port, timeout, credentials),
+        "audio_device": (
+            check_audio_device(audio_player) if audio_player is not None
+            else check_remote_audio(host, port, timeout, credentials)
+        )
+    }
+    results = await asyncio.gather(
+        *(_run_check(name, check, deadline) for name, check in checks.items())
+    )
+
+    return DiagnosticsReport(
+        success=all(result.success for result in results),
+        target=f"{host}:{port}",
+        duration_ms=round((time.perf_counter() - start) * 1000, 2),
+        checks=list(results)
+    )
+
+
+def print_report(report: DiagnosticsReport):
+    """以可读格式输出诊断报告"""
+    print("=" * 60)
+    print(f"Claude Hook Notification Service 诊断报告: {report.target}")
+    print("=" * 60)
+    for check in report.checks:
+        mark = "✓" if check.success else "✗"
+        print(f"{mark} {check.name:<14} ({check.duration_ms:.1f} ms)")
+        for key, value in check.details.items():
+            print(f"      {key}: {value}")
+        if check.error:
+            print(f"      错误: {check.error}")
+    print("-" * 60)
+    print(f"结果: {'全部通过' if report.success else '存在失败项'}  总耗时: {report.duration_ms:.1f} ms")
+
+
+def main():
+    """命令行入口"""
+    config = Dynaconf(
+        envvar_prefix="CLAUDE",
+        settings_files=["config.toml"],
+        load_dotenv=True
+    )
+
+    parser = argparse.ArgumentParser(description="Claude Hook Notification Service 诊断工具")
+    parser.add_argument("--host", default="127.0.0.1", help="服务地址")
+    parser.add_argument("--port", type=int, default=config.server.port, help="服务端口")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="诊断总超时 (秒)")
+    parser.add_argument("--samples", type=int, default=LATENCY_SAMPLES, help="延迟测量次数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 格式输出报告")
+    parser.add_argument("--token", default=None, help="接入认证令牌 (默认读取 config.toml)")
+    parser.add_argument("--hmac-secret", default=None, help="HMAC 签名密钥 (默认读取 config.toml)")
+    args = parser.parse_args()
+
+    configured = Credentials.from_config(config)
+    credentials = Credentials(
+        token=args.token or configured.token,
+        hmac_secret=args.hmac_secret or configured.hmac_secret
+    )
+
+    report = asyncio.run(run_diagnostics(
+        args.host,
+        args.port,
+        timeout=args.timeout,
+        samples=args.samples,
+        credentials=credentials
+    ))
+    if args.json:
+        print(report.model_dump_json(indent=2))
+    else:
+        print_report(report)
+    sys.exit(0 if report.success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+事件历史存储模块
+使用 SQLite (WAL 模式) 保存 Hook 事件历史，后台线程批量写入，支持按时间窗口统计
+"""
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dynaconf import Dynaconf
+from loguru import logger
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    event_type TEXT NOT NULL,
+    source TEXT,
+    session_id TEXT,
+    sound_type TEXT,
+    success INTEGER NOT NULL,
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_ts_latency ON events (ts, latency_ms);
+CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events (event_type, ts);
+CREATE INDEX IF NOT EXISTS idx_events_source_ts ON events (source, ts);
+CREATE INDEX IF NOT EXISTS idx_events_session_ts ON events (session_id, ts);
+"""
+
+INSERT_SQL = """
+INSERT INTO events (ts, event_type, source, session_id, sound_type, success, latency_ms)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+PERCENTILES = (50, 90, 99)
+
+# 写入队列中的停止标记
+_STOP = object()
+
+
+def _as_text(value: Any) -> Optional[str]:
+    """将载荷中的任意值转换为可写入 TEXT 列的字符串，容器等复杂类型视为缺失"""
+    if value is None or isinstance(value, (dict, list, tuple, set)):
+        return None
+    return str(value)
+
+
+class HistoryStore:
+    """事件历史存储类"""
+
+    def __init__(self, config: Dynaconf):
+        history_config = config.history
+        self.db_path = Path(history_config.get("db_path", "history.db"))
+        self.batch_size = int(history_config.get("batch_size", 200))
+        self.flush_interval = float(history_config.get("flush_interval", 1.0))
+        self.retention_seconds = float(history_config.get("retention_days", 30)) * 86400
+        self.retention_interval = float(history_config.get("retention_interval", 3600))
+        self.delete_batch_size = int(history_config.get("delete_batch_size", 5000))
+        # 事件等待开始播放的最长时间，超时记为失败
+        self.start_timeout = float(history_config.get("start_timeout", 30))
+        self.queue: queue.Queue = queue.Queue(maxsize=int(history_config.get("queue_size", 10000)))
+        self.dropped = 0
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+        self._writer = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+        logger.info(f"事件历史存储初始化完成，数据库: {self.db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(
+        self,
+        event_type: str,
+        source: Optional[str],
+        session_id: Optional[str],
+        sound_type: Optional[str],
+        success: bool,
+        latency_ms: Optional[float],
+        ts: Optional[float] = None
+    ):
+        """记录一条事件 (仅入队，不等待磁盘写入)"""
+        row = (
+            ts if ts is not None else time.time(),
+            _as_text(event_type),
+            _as_text(source),
+            _as_text(session_id),
+            _as_text(sound_type),
+            int(bool(success)),
+            float(latency_ms) if latency_ms is not None else None
+        )
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"事件历史写入队列已满，已丢弃 {self.dropped} 条记录")
+
+    def _writer_loop(self):
+        """后台写入线程: 批量插入事件并定期清理过期数据"""
+        conn = self._connect()
+        next_retention = time.monotonic()
+        stopping = False
+
+        while not stopping:
+            batch = []
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            if batch:
+                self._insert_batch(conn, batch)
+
+            if time.monotonic() >= next_retention:
+                self._apply_retention(conn)
+                next_retention = time.monotonic() + self.retention_interval
+
+        conn.close()
+
+    def _insert_batch(self, conn: sqlite3.Connection, batch: List[tuple]):
+        """批量插入事件，批量失败时逐条重试，只丢弃有问题的记录"""
+        try:
+            with conn:
+                conn.executemany(INSERT_SQL, batch)
+            return
+        except sqlite3.Error as e:
+            logger.warning(f"批量写入事件历史失败 ({len(batch)} 条)，改为逐条写入: {e}")
+
+        failed = 0
+        with conn:
+            for row in batch:
+                try:
+                    conn.execute(INSERT_SQL, row)
+                except sqlite3.Error as e:
+                    failed += 1
+                    logger.error(f"写入事件历史失败，已跳过: {row}, 错误: {e}")
+        if failed:
+            self.dropped += failed
+
+    def _apply_retention(self, conn: sqlite3.Connection):
+        """分批删除超过保留期的事件，避免长时间占用写锁"""
+        cutoff = time.time() - self.retention_seconds
+        deleted = 0
+        try:
+            while True:
+                with conn:
+                    cursor = conn.execute(
+                        "DELETE FROM events WHERE id IN "
+                        "(SELECT id FROM events WHERE ts < ? LIMIT ?)",
+                        (cutoff, self.delete_batch_size)
+                    )
+                deleted += cursor.rowcount
+                if cursor.rowcount < self.delete_batch_size:
+                    break
+        except sqlite3.Error as e:
+            logger.error(f"清理过期事件历史失败: {e}")
+            return
+
+        if deleted:
+            logger.info(f"已清理 {deleted} 条过期事件历史")
+
+    def query_stats(
+        self,
+        windows: List[int],
+        event_type: Optional[str] = None,
+        source: Optional[str] = None,
+        session_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """统计各时间窗口内的事件数量、速率和播放延迟分位数 (同步执行，应放在线程池中调用)"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            return [
+                self._window_stats(conn, now, window, event_type, source, session_id)
+                for window in windows
+            ]
+        finally:
+            conn.close()
+
+    def _window_stats(
+        self,
+        conn: sqlite3.Connection,
+        now: float,
+        window: int,
+        event_type: Optional[str],
+        source: Optional[str],
+        session_id: Optional[str]
+    ) -> Dict[str, Any]:
+        where, params = self._build_filter(now - window, event_type, source, session_id)
+
+        by_type = conn.execute(
+            f"SELECT event_type, COUNT(*), SUM(1 - success) FROM events WHERE {where} "
+            "GROUP BY event_type ORDER BY COUNT(*) DESC",
+            params
+        ).fetchall()
+        total = sum(row[1] for row in by_type)
+
+        # 每个窗口只排序一次，分位数直接按下标取值
+        latencies = [
+            row[0] for row in conn.execute(
+                f"SELECT latency_ms FROM events WHERE {where} AND latency_ms IS NOT NULL "
+                "ORDER BY latency_ms",
+                params
+            )
+        ]
+        latency = {}
+        for pct in PERCENTILES:
+            if not latencies:
+                latency[f"p{pct}_ms"] = None
+                continue
+            index = min(len(latencies) - 1, (len(latencies) * pct) // 100)
+            latency[f"p{pct}_ms"] = round(latencies[index], 2)
+
+        return {
+            "window_seconds": window,
+            "total": total,
+            "failed": sum(row[2] or 0 for row in by_type),
+            "rate_per_minute": round(total / window * 60, 3),
+            "by_event_type": {row[0]: row[1] for row in by_type},
+            "latency": latency
+        }
+
+    @staticmethod
+    def _build_filter(
+        since: float,
+        event_type: Optional[str],
+        source: Optional[str],
+        session_id: Optional[str]
+    ) -> Tuple[str, Tuple[Any, ...]]:
+        clauses = ["ts >= ?"]
+        params: List[Any] = [since]
+        for column, value in (("event_type", event_type), ("source", source), ("session_id", session_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return " AND ".join(clauses), tuple(params)
+
+    def _stop_writer(self):
+        self.queue.put(_STOP)
+        self._writer.join(timeout=10)
+
+    async def close(self):
+        """停止后台写入线程，写入剩余事件 (在线程池中等待，不阻塞事件循环)"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._stop_writer)
+        logger.info("事件历史存储已关闭")
+
+
+def create_history_store(config: Dynaconf) -> Optional[HistoryStore]:
+    """根据配置创建事件历史存储，未启用时返回 None"""
+    history_config = config.get("history")
+    if not history_config or not history_config.get("enabled", True):
+        return None
+    return HistoryStore(config)
@@ -5,17 +5,30 @@ Claude Code Hook Notification Service
 import asyncio
 import os
 import sys
+import time
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Dict, Any, Optional
 
 import uvicorn
 from dynaconf import Dynaconf
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
 from loguru import logger
 from pydantic import BaseModel, Field
 
 from audio_player import AudioPlayer, get_sound_type_for_hook
+from diagnostics import (
+    PROBE_FIELD,
+    PROBE_WAIT_MAX,
+    DiagnosticsReport,
+    ProbeRegistry,
+    check_audio_device,
+    run_diagnostics
+)
+from history import HistoryStore, create_history_store
+from security import Credentials, IngestGuardMiddleware, IngestPolicy
+from speech import SpeechAnnouncer, create_speech_announcer
+from tracing import RECEIVED_STATE_KEY, Trace, TraceStartMiddleware, Tracer, create_tracer
 
 
 # Pydantic 模型定义
@@ -38,12 +51,17 @@ class NotificationResponse(BaseModel):
 # 全局变量
 config: Dynaconf = None
 audio_player: AudioPlayer = None
+speech_announcer: Optional[SpeechAnnouncer] = None
+history_store: Optional[HistoryStore] = None
+tracer: Optional[Tracer] = None
+ingest_policy = IngestPolicy()
+diagnostics_probes = ProbeRegistry()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """FastAPI 生命周期管理"""
-    global config, audio_player
+    global config, audio_player, speech_announcer, history_store, tracer
     
     # 启动时初始化
     logger.info("Claude Hook Notification Service 启动中...")
@@ -63,17 +81,33 @@ async def lifespan(app: FastAPI):
         format=config.logging.format
     )
     
+    # 初始化接入认证与限流策略
+    ingest_policy.configure(config)
+    
     # 初始化音频播放器
     audio_player = AudioPlayer(config)
     
+    # 初始化语音播报器 (可选)
+    speech_announcer = create_speech_announcer(config, audio_player)
+    
+    # 初始化事件历史存储
+    history_store = create_history_store(config)
+    
+    # 初始化链路追踪
+    tracer = create_tracer(config)
+    
     logger.info(f"服务启动在 {config.server.host}:{config.server.port}")
     
     yield
     
     # 关闭时清理
     logger.info("Claude Hook Notification Service 关闭中...")
+    if speech_announcer:
+        await speech_announcer.cleanup()
     if audio_player:
         await audio_player.cleanup()
+    if history_store:
+        await history_store.close()
 
 
 # 创建 FastAPI 应用
@@ -84,6 +118,11 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# 认证与限流在路由之前执行，被拒绝的请求不会进入请求体解析
+app.add_middleware(IngestGuardMiddleware, policy=ingest_policy)
+# 最外层中间件，记录请求到达时间用于链路追踪
+app.add_middleware(TraceStartMiddleware)
+
 
 @app.get("/")
 async def root():
@@ -102,19 +141,94 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": asyncio.get_event_loop().time(),
-        "audio_available": audio_player is not None
+        "audio_available": audio_player is not None,
+        "speech_available": speech_announcer is not None
     }
 
 
+def record_outcome(
+    request: HookEventRequest,
+    sound_type: str,
+    received_at: float,
+    latency_ms: Optional[float]
+):
+    """
+    记录事件结果 (latency_ms 为 None 表示未能开始播放)
+    诊断往返测试事件不写入历史，而是报告探测结果
+    """
+    payload = request.payload or {}
+    probe_id = payload.get(PROBE_FIELD)
+    if probe_id:
+        diagnostics_probes.resolve(
+            str(probe_id),
+            {"success": True, "latency_ms": latency_ms} if latency_ms is not None
+            else {"success": False, "error": "测试事件未能开始播放"}
+        )
+    elif history_store:
+        history_store.record(
+            event_type=request.event_type,
+            source=request.source,
+            session_id=payload.get("session_id"),
+            sound_type=sound_type,
+            success=latency_ms is not None,
+            latency_ms=latency_ms,
+            ts=received_at
+        )
+
+
+async def play_and_record(
+    request: HookEventRequest,
+    sound_type: str,
+    received_at: float,
+    received_perf: float,
+    trace: Optional[Trace] = None
+):
+    """
+    播放事件音频，在开始播放时 (而不是播放结束后) 记录事件及从接收到开始播放的延迟
+    播放失败或超过 start_timeout 仍未开始 (如排在卡住的播放之后) 时记为失败，历史写入不受播放时长和播放卡死影响
+    """
+    if trace is not None:
+        trace.add_span("background_wait", trace.checkpoint, time.perf_counter())
+    loop = asyncio.get_running_loop()
+    started: asyncio.Future = loop.create_future()
+
+    def on_start(timestamp: float):
+        # 在音频播放线程中调用
+        loop.call_soon_threadsafe(started.set_result, timestamp)
+
+    play = asyncio.ensure_future(audio_player.play_sound_async(sound_type, trace, on_start=on_start))
+    await asyncio.wait(
+        {started, play},
+        timeout=history_store.start_timeout if history_store else None,
+        return_when=asyncio.FIRST_COMPLETED
+    )
+    latency_ms = round((started.result() - received_perf) * 1000, 2) if started.done() else None
+    record_outcome(request, sound_type, received_at, latency_ms)
+
+    success = await play
+    if trace is not None:
+        trace.attrs["success"] = success
+        trace.finish()
+    return success
+
+
 @app.post("/notify/hook", response_model=NotificationResponse)
 async def handle_hook_notification(
     request: HookEventRequest,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    raw_request: Request
 ):
     """
     处理 Claude Hook 事件通知
     这是主要的接收 Claude Code hooks 事件的端点
     """
+    received_at, received_perf = time.time(), time.perf_counter()
+    trace = None
+    if tracer:
+        arrived = raw_request.scope.get("state", {}).get(RECEIVED_STATE_KEY, received_perf)
+        trace = tracer.start("hook", start=arrived, event_type=request.event_type, source=request.source)
+        if trace is not None:
+            trace.add_span("http_parse", arrived, received_perf)
     logger.info(f"收到 Hook 事件: {request.event_type}")
     logger.debug(f"事件详情: {request.model_dump()}")
     
@@ -127,7 +241,16 @@ async def handle_hook_notification(
     
     try:
         # 在后台任务中播放音频，避免阻塞响应
-        background_tasks.add_task(audio_player.play_sound_async, sound_type)
+        background_tasks.add_task(play_and_record, request, sound_type, received_at, received_perf, trace)
+        
+        # 语音播报在提示音之后进行，合成在进程池中完成，不阻塞事件接收
+        if speech_announcer:
+            background_tasks.add_task(
+                speech_announcer.announce_async,
+                request.event_type,
+                request.payload,
+                request.source
+            )
         
         response = NotificationResponse(
             success=True,
@@ -137,6 +260,9 @@ async def handle_hook_notification(
         )
         
         logger.info(f"Hook 事件处理完成: {request.event_type} -> {sound_type}")
+        if trace is not None:
+            trace.checkpoint = time.perf_counter()
+            trace.add_span("handler", received_perf, trace.checkpoint)
         return response
         
     except Exception as e:
@@ -222,6 +348,118 @@ async def list_available_sounds():
     }
 
 
+@app.get("/stats")
+async def get_event_stats(
+    windows: str = Query(default="60,3600,86400", description="统计时间窗口 (秒)，逗号分隔"),
+    event_type: Optional[str] = None,
+    source: Optional[str] = None,
+    session_id: Optional[str] = None
+):
+    """
+    查询事件统计
+    返回各时间窗口内的事件数量、速率和播放延迟分位数，可按事件类型、来源和会话过滤
+    """
+    if not history_store:
+        raise HTTPException(status_code=503, detail="事件历史存储未启用")
+    
+    try:
+        window_list = [int(w) for w in windows.split(",") if w.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的时间窗口: {windows}")
+    if not window_list or any(w <= 0 for w in window_list):
+        raise HTTPException(status_code=400, detail=f"无效的时间窗口: {windows}")
+    
+    # 在线程池中查询，避免阻塞事件循环
+    loop = asyncio.get_event_loop()
+    stats = await loop.run_in_executor(
+        None,
+        history_store.query_stats,
+        window_list,
+        event_type,
+        source,
+        session_id
+    )
+    return {
+        "filters": {"event_type": event_type, "source": source, "session_id": session_id},
+        "windows": stats,
+        "dropped": history_store.dropped
+    }
+
+
+@app.get("/debug/slowest")
+async def debug_slowest(limit: int = Query(default=10, ge=1, le=1000)):
+    """
+    列出最近被采样的事件中最慢的若干个
+    返回每个事件的总耗时和各阶段 (请求解析、等待后台任务、等待播放线程、加载、启动、播放) 的耗时
+    """
+    if not tracer:
+        raise HTTPException(status_code=503, detail="链路追踪未启用")
+    
+    return {
+        "sample_rate": tracer.sample_rate,
+        "slowest": tracer.slowest(limit)
+    }
+
+
+@app.get("/debug/traces")
+async def debug_traces():
+    """导出最近被采样的事件追踪，格式为 Chrome trace-event JSON，可在 chrome://tracing 或 Perfetto 中打开"""
+    if not tracer:
+        raise HTTPException(status_code=503, detail="链路追踪未启用")
+    
+    return tracer.export_chrome_trace()
+
+
+@app.get("/diagnostics", response_model=DiagnosticsReport)
+async def run_self_diagnostics(
+    timeout: float = Query(default=10.0, gt=0, le=60, description="诊断总超时 (秒)")
+):
+    """
+    服务自诊断
+    并发检查主机可达性、端口、HTTP 往返延迟、测试事件完整往返和音频设备，返回结构化报告
+    """
+    if not config or not audio_player:
+        raise HTTPException(status_code=500, detail="服务未初始化")
+    
+    report = await run_diagnostics(
+        "127.0.0.1",
+        config.server.port,
+        audio_player=audio_player,
+        timeout=timeout,
+        credentials=Credentials.from_config(config)
+    )
+    logger.info(f"自诊断完成: {'通过' if report.success else '失败'}, 耗时 {report.duration_ms} ms")
+    return report
+
+
+@app.get("/diagnostics/roundtrip/{probe_id}")
+async def diagnostics_roundtrip(
+    probe_id: str,
+    timeout: float = Query(default=10.0, gt=0, le=PROBE_WAIT_MAX, description="等待超时 (秒)")
+):
+    """
+    等待诊断测试事件开始播放
+    测试事件由调用方通过 /notify/hook 发送 (payload 中带 diagnostics_probe 标记)，
+    返回从服务接收事件到开始播放的延迟，与事件历史中的播放延迟口径一致
+    """
+    try:
+        return await diagnostics_probes.wait(probe_id, timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="等待测试事件播放超时")
+
+
+@app.get("/diagnostics/audio")
+async def diagnostics_audio():
+    """检查音频输出设备和音频文件"""
+    if not audio_player:
+        raise HTTPException(status_code=500, detail="音频播放器未初始化")
+    
+    try:
+        return {"success": True, "details": await check_audio_device(audio_player)}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
 def main():
     """主程序入口"""
     # 临时加载配置以获取服务器设置
@@ -0,0 +1,363 @@
+"""
+接入安全模块 - 请求认证与限流
+以纯 ASGI 中间件的形式在路由和 Pydantic 解析之前拒绝未认证或超出速率的请求，使洪水流量的处理成本降到最低
+"""
+import hashlib
+import hmac
+import json
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from dynaconf import Dynaconf
+from loguru import logger
+
+
+TOKEN_HEADER = b"x-beacon-token"
+TIMESTAMP_HEADER = b"x-beacon-timestamp"
+SIGNATURE_HEADER = b"x-beacon-signature"
+
+# "/diagnostics" 前缀同时覆盖 /diagnostics、/diagnostics/roundtrip 和 /diagnostics/audio
+DEFAULT_PROTECTED_PATHS = ["/notify/", "/test/sound/", "/diagnostics"]
+
+# 未认证请求的拒绝日志最短间隔 (秒)，避免洪水流量刷屏
+REJECTION_LOG_INTERVAL = 10.0
+
+
+def _now() -> float:
+    """限流和日志采样使用的单调时钟"""
+    return time.monotonic()
+
+
+def signing_payload(method: bytes, target: bytes, timestamp: bytes, body: bytes) -> bytes:
+    """
+    HMAC 签名内容: "<METHOD>\n<path?query>\n<unix 时间戳>\n" + 请求体
+    覆盖方法、路径和查询参数，防止签名被挪用到其他接口或参数上
+    """
+    return method.upper() + b"\n" + target + b"\n" + timestamp + b"\n" + body
+
+
+def build_auth_headers(
+    method: str,
+    target: str,
+    token: Optional[str] = None,
+    hmac_secret: Optional[str] = None,
+    body: bytes = b""
+) -> Dict[str, str]:
+    """生成请求认证头，target 为实际发送的请求路径 (含查询参数)"""
+    headers = {}
+    if token:
+        headers["X-Beacon-Token"] = token
+    if hmac_secret:
+        timestamp = str(int(time.time()))
+        signature = hmac.new(
+            hmac_secret.encode("utf-8"),
+            signing_payload(method.encode("ascii"), target.encode("utf-8"), timestamp.encode("ascii"), body),
+            hashlib.sha256
+        ).hexdigest()
+        headers["X-Beacon-Timestamp"] = timestamp
+        headers["X-Beacon-Signature"] = signature
+    return headers
+
+
+class Credentials(NamedTuple):
+    """客户端认证凭据 (令牌和/或 HMAC 密钥)，用于为每个请求生成认证头"""
+    token: Optional[str] = None
+    hmac_secret: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, config: Dynaconf) -> "Credentials":
+        """使用配置中的第一个令牌和 HMAC 密钥"""
+        security_config = config.get("security") or {}
+        tokens = list(security_config.get("tokens", []))
+        return cls(
+            token=tokens[0] if tokens else None,
+            hmac_secret=security_config.get("hmac_secret") or None
+        )
+
+    def headers(self, method: str, target: str, body: bytes = b"") -> Dict[str, str]:
+        return build_auth_headers(method, target, self.token, self.hmac_secret, body)
+
+
+class _Bucket:
+    """令牌桶状态"""
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """按客户端键的令牌桶限流器，空闲的客户端会被定期清除"""
+
+    def __init__(self, rate: float, burst: float, idle_seconds: float, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.idle_seconds = idle_seconds
+        self.max_clients = max_clients
+        self._buckets: Dict[str, _Bucket] = {}
+        self._next_sweep = _now() + idle_seconds
+
+    def acquire(self, key: str) -> float:
+        """尝试消耗一个令牌，成功返回 0，否则返回建议的重试等待秒数"""
+        bucket = self._refill(key)
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            return 0.0
+        return (1.0 - bucket.tokens) / self.rate
+
+    def check(self, key: str) -> float:
+        """只检查而不消耗令牌，可以通过时返回 0，否则返回建议的重试等待秒数"""
+        bucket = self._refill(key)
+        return 0.0 if bucket.tokens >= 1.0 else (1.0 - bucket.tokens) / self.rate
+
+    def _refill(self, key: str) -> _Bucket:
+        now = _now()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                # 表已满时淘汰最早加入的客户端
+                del self._buckets[next(iter(self._buckets))]
+            bucket = self._buckets[key] = _Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+
+    def _sweep(self, now: float):
+        cutoff = now - self.idle_seconds
+        idle = [key for key, bucket in self._buckets.items() if bucket.updated < cutoff]
+        for key in idle:
+            del self._buckets[key]
+        if idle:
+            logger.debug(f"限流表清除 {len(idle)} 个空闲客户端")
+        self._next_sweep = now + self.idle_seconds
+
+
+class IngestPolicy:
+    """接入策略: 认证密钥和限流器，在服务启动时根据配置初始化"""
+
+    def __init__(self):
+        self.enabled = False
+        self.protected_paths: Tuple[str, ...] = ()
+        self.max_body_bytes = 65536
+        self.max_skew = 300.0
+        self.rate_limit_key = "ip"
+        self.limiter: Optional[RateLimiter] = None
+        self._token_digests: Dict[bytes, str] = {}
+        self._hmac_base = None
+
+    def configure(self, config: Dynaconf):
+        """根据配置初始化策略"""
+        security_config = config.get("security")
+        if not security_config or not security_config.get("enabled", False):
+            self.enabled = False
+            return
+
+        self.protected_paths = tuple(security_config.get("protected_paths", DEFAULT_PROTECTED_PATHS))
+        self.max_body_bytes = int(security_config.get("max_body_bytes", 65536))
+        self.max_skew = float(security_config.get("max_skew", 300))
+        self.rate_limit_key = security_config.get("rate_limit_key", "ip")
+
+        # 预先计算令牌摘要: 比较定长摘要而非原始令牌，查找耗时与令牌内容无关
+        tokens: List[str] = list(security_config.get("tokens", []))
+        self._token_digests = {
+            hashlib.sha256(token.encode("utf-8")).digest(): f"token-{index}"
+            for index, token in enumerate(tokens)
+        }
+
+        # 预先完成 HMAC 密钥处理，每个请求只需复制状态
+        hmac_secret = security_config.get("hmac_secret", "")
+        self._hmac_base = (
+            hmac.new(hmac_secret.encode("utf-8"), digestmod=hashlib.sha256) if hmac_secret else None
+        )
+
+        rate = float(security_config.get("rate", 5.0))
+        self.limiter = RateLimiter(
+            rate=rate,
+            burst=float(security_config.get("burst", 20)),
+            idle_seconds=float(security_config.get("idle_seconds", 300)),
+            max_clients=int(security_config.get("max_clients", 10000))
+        ) if rate > 0 else None
+
+        self.enabled = True
+        logger.info(
+            f"接入安全已启用: 令牌 {len(self._token_digests)} 个, "
+            f"HMAC {'启用' if self._hmac_base else '未启用'}, "
+            f"限流 {'按 ' + self.rate_limit_key if self.limiter is not None else '未启用'}"
+        )
+
+    @property
+    def auth_required(self) -> bool:
+        return bool(self._token_digests) or self._hmac_base is not None
+
+    @property
+    def limit_by_identity(self) -> bool:
+        """按令牌 (客户端身份) 限流，未配置认证时无法区分身份，回落为按 IP 限流"""
+        return self.limiter is not None and self.rate_limit_key == "token" and self.auth_required
+
+    @property
+    def needs_body(self) -> bool:
+        """HMAC 校验需要读取完整请求体"""
+        return self._hmac_base is not None
+
+    def is_protected(self, path: str) -> bool:
+        return path.startswith(self.protected_paths)
+
+    def authenticate(
+        self,
+        headers: Dict[bytes, bytes],
+        body: bytes,
+        method: bytes = b"",
+        target: bytes = b""
+    ) -> Optional[str]:
+        """校验请求认证信息，成功时返回客户端身份，失败返回 None"""
+        token = headers.get(TOKEN_HEADER)
+        if token and self._token_digests:
+            identity = self._token_digests.get(hashlib.sha256(token).digest())
+            if identity:
+                return identity
+
+        signature = headers.get(SIGNATURE_HEADER)
+        timestamp = headers.get(TIMESTAMP_HEADER)
+        if signature and timestamp and self._hmac_base is not None:
+            try:
+                skew = abs(time.time() - int(timestamp))
+            except ValueError:
+                return None
+            if skew > self.max_skew:
+                return None
+            mac = self._hmac_base.copy()
+            mac.update(signing_payload(method, target, timestamp, body))
+            if hmac.compare_digest(mac.hexdigest().encode("ascii"), signature.lower()):
+                return "hmac"
+
+        return None
+
+
+class IngestGuardMiddleware:
+    """在路由之前执行认证和限流的 ASGI 中间件"""
+
+    def __init__(self, app, policy: IngestPolicy):
+        self.app = app
+        self.policy = policy
+        self._next_rejection_log = 0.0
+        self._suppressed_rejections = 0
+
+    async def __call__(self, scope, receive, send):
+        policy = self.policy
+        if scope["type"] != "http" or not policy.enabled or not policy.is_protected(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+
+        # 认证前先按 IP 限流，使洪水流量在摘要计算和读取请求体之前就被拒绝
+        # 按令牌限流时，IP 令牌桶只计入认证失败的请求，已认证的请求只受其身份的令牌桶限制
+        if policy.limiter is not None:
+            ip_key = f"ip:{client_ip}"
+            if policy.limit_by_identity:
+                retry_after = policy.limiter.check(ip_key)
+            else:
+                retry_after = policy.limiter.acquire(ip_key)
+            if retry_after:
+                await self._reject(send, 429, "请求过于频繁", retry_after)
+                return
+
+        if policy.auth_required:
+            headers = dict(scope["headers"])
+            body = b""
+            if policy.needs_body and SIGNATURE_HEADER in headers:
+                body = await self._read_body(receive)
+                if body is None:
+                    await self._reject(send, 413, "请求体过大")
+                    return
+                receive = self._replay(body, receive)
+
+            identity = policy.authenticate(
+                headers,
+                body,
+                scope["method"].encode("ascii"),
+                self._request_target(scope)
+            )
+            if identity is None:
+                if policy.limit_by_identity:
+                    policy.limiter.acquire(ip_key)
+                self._log_rejection(client_ip, scope["path"])
+                await self._reject(send, 401, "认证失败")
+                return
+
+            if policy.limit_by_identity:
+                retry_after = policy.limiter.acquire(f"id:{identity}")
+                if retry_after:
+                    await self._reject(send, 429, "请求过于频繁", retry_after)
+                    return
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def _request_target(scope) -> bytes:
+        """客户端实际请求的路径 (含查询参数)，与签名时使用的 target 一致"""
+        target = scope.get("raw_path") or scope["path"].encode("utf-8")
+        query = scope.get("query_string", b"")
+        return target + b"?" + query if query else target
+
+    def _log_rejection(self, client_ip: str, path: str):
+        """按最短间隔记录拒绝日志，期间的拒绝只计数"""
+        now = _now()
+        if now < self._next_rejection_log:
+            self._suppressed_rejections += 1
+            return
+
+        suppressed = self._suppressed_rejections
+        suffix = f" (此前 {suppressed} 次拒绝未记录)" if suppressed else ""
+        logger.warning(f"拒绝未认证请求: {client_ip} {path}{suffix}")
+        self._suppressed_rejections = 0
+        self._next_rejection_log = now + REJECTION_LOG_INTERVAL
+
+    async def _read_body(self, receive) -> Optional[bytes]:
+        """读取完整请求体，超过上限时返回 None"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.policy.max_body_bytes:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        """将已读取的请求体重新提供给下游应用，之后的消息 (如断开连接) 交还原始通道"""
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return replay_receive
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, retry_after: float = 0.0):
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii"))
+        ]
+        if retry_after:
+            headers.append((b"retry-after", str(max(1, int(retry_after + 0.999))).encode("ascii")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
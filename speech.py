@@ -0,0 +1,367 @@
+"""
+语音播报模块 - 基于事件载荷模板生成语音提醒
+使用本地离线 TTS 引擎合成语音，并通过内容寻址的磁盘 + 内存缓存复用已合成的短语
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import string
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from dynaconf import Dynaconf
+from loguru import logger
+
+# 注意: 合成子进程以 spawn 方式启动并重新导入本模块，不能在模块级别导入 audio_player (会初始化 pygame.mixer)
+if TYPE_CHECKING:
+    from audio_player import AudioPlayer
+
+try:
+    import pyttsx3
+    PYTTSX3_AVAILABLE = True
+except ImportError:
+    PYTTSX3_AVAILABLE = False
+
+
+# 合成子进程内复用的 TTS 引擎实例
+_worker_engine = None
+
+
+def _synthesize_to_file(text: str, out_path: str, voice: str, rate: int) -> bool:
+    """在子进程中将文本合成为 WAV 文件"""
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = pyttsx3.init()
+        if voice:
+            _worker_engine.setProperty("voice", voice)
+        if rate:
+            _worker_engine.setProperty("rate", rate)
+    _worker_engine.save_to_file(text, out_path)
+    _worker_engine.runAndWait()
+    return os.path.exists(out_path) and os.path.getsize(out_path) > 0
+
+
+def _worker_ready() -> bool:
+    """空任务: 等待合成进程启动完成，使进程启动和模块导入的耗时不计入合成超时"""
+    return True
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    创建合成进程池
+    使用 spawn 方式启动: 主进程中已有音频、历史写入等线程和 pygame/SDL 状态，fork 可能导致子进程死锁
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _terminate_pool(executor: ProcessPoolExecutor):
+    """终止进程池中的所有合成进程 (可能卡住的合成无法通过 cancel 取消)"""
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+class _TemplateFields(dict):
+    """模板字段字典，缺失字段渲染为空字符串"""
+
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+class PhraseCache:
+    """
+    内容寻址的短语音频缓存 (内存 LRU + 磁盘 LRU，均按字节数限制大小)
+    非线程安全，SpeechAnnouncer 只在单个 I/O 线程中访问
+    """
+
+    def __init__(self, cache_dir: Path, disk_max_bytes: int, memory_max_bytes: int):
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load_disk_index()
+
+    @staticmethod
+    def make_key(text: str, voice: str, rate: int) -> str:
+        """根据合成参数计算内容地址"""
+        digest = hashlib.sha256(f"{voice}\x00{rate}\x00{text}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        """获取缓存键对应的磁盘路径"""
+        return self.cache_dir / key[:2] / f"{key}.wav"
+
+    def tmp_path_for(self, key: str) -> Path:
+        """获取一次合成使用的唯一临时文件路径"""
+        path = self.cache_dir / key[:2] / f"{key}.{uuid.uuid4().hex}.tmp"
+        path.parent.mkdir(exist_ok=True)
+        return path
+
+    def _load_disk_index(self):
+        """启动时扫描磁盘缓存，按最近访问时间重建 LRU 索引，并清理上次遗留的临时文件"""
+        for path in self.cache_dir.glob("*/*.tmp"):
+            path.unlink(missing_ok=True)
+
+        entries = []
+        for path in self.cache_dir.glob("*/*.wav"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+        logger.debug(f"语音缓存索引加载完成: {len(self._disk)} 条, {self._disk_bytes} 字节")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取缓存音频，内存未命中时回落到磁盘"""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return data
+
+        if key not in self._disk:
+            return None
+
+        path = self.path_for(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            self._drop_disk_entry(key)
+            return None
+
+        self._disk.move_to_end(key)
+        self._put_memory(key, data)
+        return data
+
+    def put_file(self, key: str, tmp_path: Path) -> Optional[bytes]:
+        """将合成好的临时文件纳入缓存并返回其内容"""
+        path = self.path_for(key)
+        path.parent.mkdir(exist_ok=True)
+        os.replace(tmp_path, path)
+        data = path.read_bytes()
+
+        if key in self._disk:
+            self._disk_bytes -= self._disk[key]
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        self._disk.move_to_end(key)
+        self._evict_disk()
+
+        self._put_memory(key, data)
+        return data
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _drop_disk_entry(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+        try:
+            self.path_for(key).unlink()
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            key = next(iter(self._disk))
+            self._drop_disk_entry(key)
+            logger.debug(f"语音缓存淘汰: {key}")
+
+
+class SpeechAnnouncer:
+    """语音播报器类"""
+
+    def __init__(self, config: Dynaconf, audio_player: "AudioPlayer"):
+        speech_config = config.speech
+        self.audio_player = audio_player
+        self.templates: Dict[str, str] = dict(speech_config.get("templates", {}))
+        self.voice = speech_config.get("voice", "")
+        self.rate = int(speech_config.get("rate", 0))
+        self.synth_timeout = float(speech_config.get("synth_timeout", 10))
+        self.cache = PhraseCache(
+            Path(speech_config.get("cache_dir", ".speech_cache")),
+            disk_max_bytes=int(speech_config.get("disk_cache_max_mb", 64)) * 1024 * 1024,
+            memory_max_bytes=int(speech_config.get("memory_cache_max_mb", 8)) * 1024 * 1024,
+        )
+        self.workers = int(speech_config.get("workers", 1))
+        self.executor = _new_pool(self.workers)
+        # 同时提交到进程池的合成任务不超过进程数，排队等待不计入合成超时
+        self._slots = asyncio.Semaphore(self.workers)
+        self._ready: Optional[asyncio.Future] = None
+        # 缓存读写 (含磁盘 I/O) 统一在单个线程中执行，不阻塞事件循环
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speech-io")
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._formatter = string.Formatter()
+
+        logger.info(f"语音播报器初始化完成，模板数量: {len(self.templates)}")
+
+    def render_text(
+        self,
+        event_type: str,
+        payload: Optional[Dict[str, Any]] = None,
+        source: Optional[str] = None
+    ) -> Optional[str]:
+        """根据事件类型对应的模板渲染播报文本"""
+        template = self.templates.get(event_type)
+        if not template:
+            return None
+
+        fields = _TemplateFields(payload or {})
+        fields.setdefault("event_type", event_type)
+        fields.setdefault("source", source or "")
+        try:
+            text = self._formatter.vformat(template, (), fields).strip()
+        except (ValueError, IndexError, AttributeError, KeyError) as e:
+            logger.error(f"语音模板渲染失败: {event_type}, 错误: {e}")
+            return None
+        return text or None
+
+    async def _synthesize(self, key: str, text: str) -> Optional[bytes]:
+        """在进程池中合成语音并写入缓存，相同短语的并发请求只合成一次"""
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[key] = future
+        data = None
+        tmp_path = None
+        try:
+            tmp_path = await loop.run_in_executor(self._io_executor, self.cache.tmp_path_for, key)
+            async with self._slots:
+                ok = await self._run_synthesis(text, tmp_path)
+            if ok:
+                data = await loop.run_in_executor(self._io_executor, self.cache.put_file, key, tmp_path)
+            else:
+                logger.error(f"语音合成未生成音频: {text}")
+        except asyncio.TimeoutError:
+            logger.error(f"语音合成超时 ({self.synth_timeout}s)，已重建合成进程池: {text}")
+        except Exception as e:
+            logger.error(f"语音合成失败: {text}, 错误: {e}")
+        finally:
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+            future.set_result(data)
+            del self._pending[key]
+        return data
+
+    async def _run_synthesis(self, text: str, tmp_path: Path) -> bool:
+        """
+        在进程池中执行一次合成 (调用方需持有进程槽位，任务提交后立即由空闲进程执行)
+        超时说明正在执行的合成已卡住，此时重建进程池；超时的任务无法取消，终止旧进程后才能安全删除其临时文件
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self.executor
+            try:
+                if self._ready is None:
+                    self._ready = loop.run_in_executor(executor, _worker_ready)
+                await self._ready
+                return await asyncio.wait_for(
+                    loop.run_in_executor(
+                        executor,
+                        _synthesize_to_file,
+                        text,
+                        str(tmp_path),
+                        self.voice,
+                        self.rate
+                    ),
+                    timeout=self.synth_timeout
+                )
+            except asyncio.TimeoutError:
+                await self._recycle_executor()
+                raise
+            except BrokenProcessPool:
+                if executor is not self.executor and attempt == 0:
+                    # 进程池因其他任务超时已被重建，本任务只是被波及，重新提交一次
+                    logger.warning(f"语音合成进程池已重建，重新提交: {text}")
+                    continue
+                # 合成进程异常退出，重建进程池后由调用方记录错误
+                if executor is self.executor:
+                    await self._recycle_executor()
+                raise
+        return False
+
+    async def announce_async(
+        self,
+        event_type: str,
+        payload: Optional[Dict[str, Any]] = None,
+        source: Optional[str] = None
+    ) -> bool:
+        """异步播报指定事件"""
+        text = self.render_text(event_type, payload, source)
+        if not text:
+            return False
+
+        key = PhraseCache.make_key(text, self.voice, self.rate)
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self._io_executor, self.cache.get, key)
+        if data is None:
+            logger.debug(f"语音缓存未命中，开始合成: {text}")
+            data = await self._synthesize(key, text)
+            if data is None:
+                return False
+        else:
+            logger.debug(f"语音缓存命中: {text}")
+
+        success = await self.audio_player.play_bytes_async(data)
+        if success:
+            logger.info(f"语音播报成功: {event_type} -> {text}")
+        return success
+
+    async def _recycle_executor(self):
+        """用新的进程池替换当前进程池，并终止旧池中的进程"""
+        old_executor = self.executor
+        self.executor = _new_pool(self.workers)
+        self._ready = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _terminate_pool, old_executor)
+
+    async def cleanup(self):
+        """清理资源"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _terminate_pool, self.executor)
+        self._io_executor.shutdown(wait=True)
+        logger.info("语音播报器资源清理完成")
+
+
+def create_speech_announcer(config: Dynaconf, audio_player: "AudioPlayer") -> Optional[SpeechAnnouncer]:
+    """根据配置创建语音播报器，未启用或 TTS 引擎不可用时返回 None"""
+    speech_config = config.get("speech")
+    if not speech_config or not speech_config.get("enabled", False):
+        return None
+    if not PYTTSX3_AVAILABLE:
+        logger.warning("pyttsx3 not available, 语音播报已禁用")
+        return None
+    return SpeechAnnouncer(config, audio_player)
@@ -0,0 +1,18 @@
+"""
+测试公共夹具
+"""
+import textwrap
+
+import pytest
+from dynaconf import Dynaconf
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """根据 TOML 文本创建配置对象"""
+    def _make_config(toml: str) -> Dynaconf:
+        path = tmp_path / "config.toml"
+        path.write_text(textwrap.dedent(toml), encoding="utf-8")
+        return Dynaconf(settings_files=[str(path)])
+
+    return _make_config
@@ -0,0 +1,103 @@
+"""
+自诊断模块测试
+"""
+import asyncio
+import socket
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from diagnostics import ProbeRegistry, check_reachability, make_probe_event, run_diagnostics
+from main import app
+
+
+def _unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _FakeAudioPlayer:
+    """记录播放请求的音频播放器替身"""
+
+    def __init__(self, starts: bool = True):
+        self.starts = starts
+        self.played = []
+
+    async def play_sound_async(self, sound_type, trace=None, on_start=None):
+        self.played.append(sound_type)
+        if self.starts and on_start is not None:
+            on_start(time.perf_counter())
+        return self.starts
+
+
+async def test_probe_registry_result_before_or_after_wait():
+    probes = ProbeRegistry()
+    probes.resolve("early", {"success": True})
+    assert await probes.wait("early", 1.0) == {"success": True}
+
+    waiter = asyncio.ensure_future(probes.wait("late", 1.0))
+    await asyncio.sleep(0)
+    probes.resolve("late", {"success": False})
+    assert await waiter == {"success": False}
+
+    with pytest.raises(asyncio.TimeoutError):
+        await probes.wait("missing", 0.01)
+    assert not probes._futures
+
+
+async def test_check_reachability_treats_refused_connection_as_reachable():
+    details = await check_reachability("127.0.0.1", _unused_port())
+    assert details["address"] == "127.0.0.1"
+    assert details["port_open"] is False
+
+
+@pytest.mark.parametrize("starts", [True, False])
+def test_roundtrip_probe_goes_through_hook_path(monkeypatch, starts):
+    player = _FakeAudioPlayer(starts=starts)
+    monkeypatch.setattr(main, "audio_player", player)
+    monkeypatch.setattr(main, "history_store", None)
+    client = TestClient(app)
+
+    response = client.post("/notify/hook", json=make_probe_event("probe-1"))
+    assert response.status_code == 200
+    assert player.played == ["general_notification"]
+
+    result = client.get("/diagnostics/roundtrip/probe-1", params={"timeout": 1}).json()
+    assert result["success"] is starts
+    if starts:
+        assert result["latency_ms"] >= 0
+
+
+def test_roundtrip_probe_wait_times_out():
+    response = TestClient(app).get("/diagnostics/roundtrip/unknown", params={"timeout": 0.05})
+    assert response.status_code == 504
+
+
+async def test_run_diagnostics_reports_every_check_when_service_is_down():
+    port = _unused_port()
+    start = time.monotonic()
+    report = await run_diagnostics("127.0.0.1", port, timeout=2.0, samples=1)
+
+    assert time.monotonic() - start < 3.0
+    assert report.target == f"127.0.0.1:{port}"
+    assert not report.success
+    checks = {check.name: check for check in report.checks}
+    assert set(checks) == {"reachability", "port", "latency", "roundtrip", "audio_device"}
+    assert checks["reachability"].success
+    assert not checks["port"].success and checks["port"].error
+
+
+@pytest.mark.parametrize("timeout", [0.0, -1.0, float("nan"), float("inf")])
+async def test_run_diagnostics_rejects_unbounded_timeout(timeout):
+    with pytest.raises(ValueError):
+        await run_diagnostics("127.0.0.1", _unused_port(), timeout=timeout)
+
+
+@pytest.mark.parametrize("timeout", ["0", "-1", "nan", "61", "1e9"])
+def test_diagnostics_endpoint_validates_timeout(timeout):
+    client = TestClient(app)
+    response = client.get("/diagnostics", params={"timeout": timeout})
+    assert response.status_code == 422
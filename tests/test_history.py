@@ -0,0 +1,147 @@
+"""
+事件历史存储模块测试
+"""
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+import main
+from history import HistoryStore
+from main import HookEventRequest, play_and_record
+
+
+@pytest.fixture
+def store(make_config, tmp_path):
+    config = make_config(f"""
+        [history]
+        db_path = "{(tmp_path / 'history.db').as_posix()}"
+        flush_interval = 0.05
+        retention_days = 1
+        delete_batch_size = 3
+    """)
+    store = HistoryStore(config)
+    yield store
+    if store._writer.is_alive():
+        store._stop_writer()
+
+
+def _flush(store: HistoryStore):
+    """等待后台写入线程处理完队列"""
+    deadline = time.monotonic() + 5
+    while not store.queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+
+
+def _count(store: HistoryStore) -> int:
+    with sqlite3.connect(store.db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+def test_query_stats_counts_and_filters(store):
+    for i in range(20):
+        store.record(
+            event_type="tool-error" if i % 2 else "tool-call",
+            source="claude-code",
+            session_id="s1" if i < 10 else "s2",
+            sound_type="tool_error",
+            success=i % 5 != 0,
+            latency_ms=float(i)
+        )
+    _flush(store)
+
+    overall, = store.query_stats([3600])
+    assert overall["total"] == 20
+    assert overall["failed"] == 4
+    assert overall["by_event_type"] == {"tool-call": 10, "tool-error": 10}
+    assert overall["rate_per_minute"] == round(20 / 3600 * 60, 3)
+    assert overall["latency"] == {"p50_ms": 10.0, "p90_ms": 18.0, "p99_ms": 19.0}
+
+    session, = store.query_stats([3600], event_type="tool-error", session_id="s1")
+    assert session["total"] == 5
+    assert session["latency"]["p50_ms"] == 5.0
+
+
+def test_query_stats_windows_and_empty_latency(store):
+    now = time.time()
+    store.record("notification", None, None, None, True, None, ts=now - 7200)
+    store.record("notification", None, None, None, True, None, ts=now - 10)
+    _flush(store)
+
+    short, long = store.query_stats([60, 86400])
+    assert short["total"] == 1
+    assert long["total"] == 2
+    assert short["latency"] == {"p50_ms": None, "p90_ms": None, "p99_ms": None}
+
+
+def test_record_coerces_non_scalar_payload_values(store):
+    store.record("tool-error", "claude-code", {"id": "s1"}, "tool_error", True, 1.0)
+    store.record("tool-error", "claude-code", 42, "tool_error", True, 2.0)
+    _flush(store)
+
+    with sqlite3.connect(store.db_path) as conn:
+        rows = conn.execute("SELECT session_id FROM events ORDER BY id").fetchall()
+    assert rows == [(None,), ("42",)]
+
+
+def test_bad_row_does_not_drop_batch(store):
+    good = (time.time(), "tool-call", None, None, None, 1, 1.0)
+    bad = (time.time(), "tool-call", object(), None, None, 1, 1.0)
+    with sqlite3.connect(store.db_path) as conn:
+        store._insert_batch(conn, [good, bad, good])
+    assert _count(store) == 2
+    assert store.dropped == 1
+
+
+def test_retention_deletes_in_batches(store):
+    now = time.time()
+    for _ in range(10):
+        store.record("old", None, None, None, True, None, ts=now - 3 * 86400)
+    store.record("new", None, None, None, True, None, ts=now)
+    _flush(store)
+
+    with sqlite3.connect(store.db_path) as conn:
+        store._apply_retention(conn)
+    assert _count(store) == 1
+
+
+async def test_close_flushes_pending_rows(store):
+    store.record("tool-call", None, None, None, True, 1.0)
+    await store.close()
+    assert not store._writer.is_alive()
+    assert _count(store) == 1
+
+
+class _StuckAudioPlayer:
+    """开始播放后 (或在开始前) 一直卡住的音频播放器替身"""
+
+    def __init__(self, starts: bool):
+        self.starts = starts
+
+    async def play_sound_async(self, sound_type, trace=None, on_start=None):
+        if self.starts:
+            on_start(time.perf_counter())
+        await asyncio.Event().wait()
+
+
+@pytest.mark.parametrize("starts", [True, False])
+async def test_event_is_recorded_without_waiting_for_playback_end(store, monkeypatch, starts):
+    store.start_timeout = 0.1
+    monkeypatch.setattr(main, "audio_player", _StuckAudioPlayer(starts))
+    monkeypatch.setattr(main, "history_store", store)
+    request = HookEventRequest(event_type="tool-error", payload={"session_id": "s1"})
+
+    task = asyncio.ensure_future(
+        play_and_record(request, "tool_error", time.time(), time.perf_counter())
+    )
+    await asyncio.sleep(0.3)
+    assert not task.done()
+    task.cancel()
+
+    await asyncio.get_running_loop().run_in_executor(None, _flush, store)
+    with sqlite3.connect(store.db_path) as conn:
+        success, latency = conn.execute("SELECT success, latency_ms FROM events").fetchone()
+    assert success == int(starts)
+    assert (latency is not None) is starts
@@ -0,0 +1,261 @@
+"""
+接入安全模块测试
+"""
+import hashlib
+import hmac
+import time
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import security
+from security import (
+    Credentials,
+    IngestGuardMiddleware,
+    IngestPolicy,
+    RateLimiter,
+    build_auth_headers,
+    signing_payload
+)
+
+
+SECRET = "s3cret"
+
+
+class _Clock:
+    """可手动推进的 security._now 替身"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(security, "_now", fake)
+    return fake
+
+
+@pytest.fixture
+def make_policy(make_config):
+    def _make_policy(extra: str = "", burst: int = 3) -> IngestPolicy:
+        policy = IngestPolicy()
+        policy.configure(make_config(f"""
+            [security]
+            enabled = true
+            tokens = ["good-token", "other-token"]
+            hmac_secret = "{SECRET}"
+            rate = 1.0
+            burst = {burst}
+            {extra}
+        """))
+        return policy
+
+    return _make_policy
+
+
+def _make_client(policy: IngestPolicy) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(IngestGuardMiddleware, policy=policy)
+
+    @app.post("/notify/hook")
+    async def notify(request: Request):
+        return {"body": (await request.body()).decode("utf-8")}
+
+    @app.get("/diagnostics")
+    async def diagnostics():
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def _lower(headers):
+    return {key.lower().encode("ascii"): value.encode("ascii") for key, value in headers.items()}
+
+
+# ---------------------------------------------------------------- RateLimiter
+
+def test_rate_limiter_allows_burst_then_limits(clock):
+    limiter = RateLimiter(rate=2.0, burst=3, idle_seconds=60, max_clients=10)
+
+    assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    # 其他客户端使用独立的令牌桶
+    assert limiter.acquire("b") == 0.0
+
+
+def test_rate_limiter_refills_over_time(clock):
+    limiter = RateLimiter(rate=2.0, burst=3, idle_seconds=60, max_clients=10)
+    for _ in range(3):
+        limiter.acquire("a")
+
+    clock.now += 0.5
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") > 0
+
+    clock.now += 100
+    assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_rate_limiter_check_does_not_consume(clock):
+    limiter = RateLimiter(rate=1.0, burst=1, idle_seconds=60, max_clients=10)
+    assert limiter.check("a") == 0.0
+    assert limiter.check("a") == 0.0
+    assert limiter.acquire("a") == 0.0
+    assert limiter.check("a") == pytest.approx(1.0)
+
+
+def test_rate_limiter_sweeps_idle_clients_and_caps_table(clock):
+    limiter = RateLimiter(rate=1.0, burst=1, idle_seconds=10, max_clients=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("c")
+    assert list(limiter._buckets) == ["b", "c"]
+
+    clock.now += 11
+    limiter.acquire("d")
+    assert list(limiter._buckets) == ["d"]
+
+
+# ---------------------------------------------------------- IngestPolicy
+
+def test_authenticate_with_token(make_policy):
+    policy = make_policy()
+    assert policy.authenticate({b"x-beacon-token": b"good-token"}, b"") == "token-0"
+    assert policy.authenticate({b"x-beacon-token": b"bad-token"}, b"") is None
+    assert policy.authenticate({}, b"") is None
+
+
+def test_authenticate_with_hmac_binds_method_path_and_query(make_policy):
+    policy = make_policy()
+    body = b'{"event_type": "stop"}'
+    headers = _lower(build_auth_headers("POST", "/notify/hook?x=1", hmac_secret=SECRET, body=body))
+
+    assert policy.authenticate(headers, body, b"POST", b"/notify/hook?x=1") == "hmac"
+    assert policy.authenticate(headers, body, b"PUT", b"/notify/hook?x=1") is None
+    assert policy.authenticate(headers, body, b"POST", b"/test/sound/stop?x=1") is None
+    assert policy.authenticate(headers, body, b"POST", b"/notify/hook?x=2") is None
+    assert policy.authenticate(headers, b"{}", b"POST", b"/notify/hook?x=1") is None
+
+
+def test_authenticate_rejects_stale_or_malformed_timestamp(make_policy):
+    policy = make_policy("max_skew = 60")
+    stale = str(int(time.time()) - 120).encode("ascii")
+    signature = hmac.new(
+        SECRET.encode("utf-8"), signing_payload(b"GET", b"/diagnostics", stale, b""), hashlib.sha256
+    ).hexdigest().encode("ascii")
+
+    assert policy.authenticate(
+        {b"x-beacon-timestamp": stale, b"x-beacon-signature": signature}, b"", b"GET", b"/diagnostics"
+    ) is None
+    assert policy.authenticate(
+        {b"x-beacon-timestamp": b"now", b"x-beacon-signature": signature}, b"", b"GET", b"/diagnostics"
+    ) is None
+
+
+def test_credentials_from_config(make_config):
+    credentials = Credentials.from_config(make_config("""
+        [security]
+        tokens = ["first", "second"]
+        hmac_secret = "abc"
+    """))
+    assert credentials == Credentials("first", "abc")
+    assert Credentials.from_config(make_config("[server]\nport = 1")) == Credentials()
+
+
+# ------------------------------------------------------- IngestGuardMiddleware
+
+def test_middleware_requires_auth_on_protected_paths(make_policy):
+    client = _make_client(make_policy())
+
+    assert client.post("/notify/hook", json={}).status_code == 401
+    assert client.get("/diagnostics").status_code == 401
+    assert client.get("/health").status_code == 200
+
+    response = client.post("/notify/hook", content=b"{}", headers={"X-Beacon-Token": "good-token"})
+    assert response.status_code == 200
+    assert response.json() == {"body": "{}"}
+
+
+def test_middleware_accepts_hmac_and_replays_body(make_policy):
+    client = _make_client(make_policy())
+    body = b'{"event_type": "stop"}'
+
+    headers = build_auth_headers("POST", "/notify/hook?source=ci", hmac_secret=SECRET, body=body)
+    response = client.post("/notify/hook?source=ci", content=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"body": body.decode("utf-8")}
+
+    # 签名不能挪用到不同的查询参数上
+    response = client.post("/notify/hook?source=other", content=body, headers=headers)
+    assert response.status_code == 401
+
+    response = client.get("/diagnostics", headers=build_auth_headers("GET", "/diagnostics", hmac_secret=SECRET))
+    assert response.status_code == 200
+
+
+def test_middleware_rejects_oversized_signed_body(make_policy):
+    client = _make_client(make_policy("max_body_bytes = 8"))
+    body = b'{"event_type": "stop"}'
+    headers = build_auth_headers("POST", "/notify/hook", hmac_secret=SECRET, body=body)
+    assert client.post("/notify/hook", content=body, headers=headers).status_code == 413
+
+
+def test_middleware_rate_limits_unauthenticated_traffic_in_token_mode(make_policy, clock):
+    client = _make_client(make_policy('rate_limit_key = "token"'))
+
+    assert [client.get("/diagnostics").status_code for _ in range(3)] == [401, 401, 401]
+    response = client.get("/diagnostics")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+
+def test_middleware_rate_limits_per_identity_in_token_mode(make_policy, clock):
+    client = _make_client(make_policy('rate_limit_key = "token"', burst=2))
+    good = {"X-Beacon-Token": "good-token"}
+    other = {"X-Beacon-Token": "other-token"}
+
+    assert [client.get("/diagnostics", headers=good).status_code for _ in range(3)] == [200, 200, 429]
+    # 同一主机上的其他令牌使用独立的令牌桶，已认证的请求不消耗 IP 令牌桶
+    assert [client.get("/diagnostics", headers=other).status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get("/diagnostics").status_code == 401
+
+
+def test_middleware_ip_mode_limits_authenticated_traffic_by_ip(make_policy, clock):
+    client = _make_client(make_policy())
+    good = {"X-Beacon-Token": "good-token"}
+    other = {"X-Beacon-Token": "other-token"}
+
+    statuses = [client.get("/diagnostics", headers=headers).status_code for headers in (good, other, good, other)]
+    assert statuses == [200, 200, 200, 429]
+
+    clock.now += 1
+    assert client.get("/diagnostics", headers=good).status_code == 200
+
+
+def test_middleware_samples_rejection_logs(make_policy, clock, monkeypatch):
+    messages = []
+    monkeypatch.setattr(security.logger, "warning", messages.append)
+    client = _make_client(make_policy(burst=100))
+
+    for _ in range(5):
+        client.get("/diagnostics")
+    assert len(messages) == 1
+
+    clock.now += security.REJECTION_LOG_INTERVAL
+    client.get("/diagnostics")
+    assert len(messages) == 2
+    assert "4 次拒绝未记录" in messages[1]
+
+
+def test_middleware_passes_through_when_disabled():
+    client = _make_client(IngestPolicy())
+    assert client.get("/diagnostics").status_code == 200
@@ -0,0 +1,135 @@
+"""
+语音播报模块测试
+"""
+import asyncio
+import time
+
+import pytest
+
+import speech
+from speech import PhraseCache, SpeechAnnouncer
+
+
+def _hang_synthesize(text, out_path, voice, rate):
+    """模拟卡住的 TTS 引擎: 先写入部分内容再长时间阻塞"""
+    with open(out_path, "wb") as f:
+        f.write(b"partial")
+    time.sleep(60)
+    return True
+
+
+def _slow_synthesize(text, out_path, voice, rate):
+    """模拟正常但较慢的 TTS 引擎"""
+    time.sleep(0.3)
+    with open(out_path, "wb") as f:
+        f.write(text.encode("utf-8"))
+    return True
+
+
+@pytest.fixture
+def announcer(make_config, tmp_path):
+    config = make_config(f"""
+        [speech]
+        enabled = true
+        cache_dir = "{(tmp_path / 'cache').as_posix()}"
+        synth_timeout = 0.5
+
+        [speech.templates]
+        tool-error = "{{tool}} 执行失败 {{session_id}}"
+        conversation-end = "{{source}} 对话结束"
+        broken = "{{tool.name}}"
+    """)
+    return SpeechAnnouncer(config, audio_player=None)
+
+
+def _put(cache: PhraseCache, tmp_path, key: str, size: int):
+    tmp = tmp_path / f"{key}.tmp"
+    tmp.write_bytes(b"x" * size)
+    return cache.put_file(key, tmp)
+
+
+def test_render_text_fills_payload_fields(announcer):
+    text = announcer.render_text("tool-error", {"tool": "Bash", "session_id": "s1"})
+    assert text == "Bash 执行失败 s1"
+
+
+def test_render_text_missing_fields_render_empty(announcer):
+    assert announcer.render_text("tool-error", {"tool": "Bash"}) == "Bash 执行失败"
+    assert announcer.render_text("conversation-end", None, source="cli") == "cli 对话结束"
+
+
+def test_render_text_without_template_or_with_bad_template(announcer):
+    assert announcer.render_text("tool-call", {"tool": "Bash"}) is None
+    assert announcer.render_text("broken", {"tool": "Bash"}) is None
+
+
+def test_phrase_cache_key_depends_on_voice_and_rate():
+    key = PhraseCache.make_key("Bash 执行失败", "", 180)
+    assert key == PhraseCache.make_key("Bash 执行失败", "", 180)
+    assert key != PhraseCache.make_key("Bash 执行失败", "", 200)
+    assert key != PhraseCache.make_key("Bash 执行失败", "zh", 180)
+
+
+def test_phrase_cache_memory_eviction(tmp_path):
+    cache = PhraseCache(tmp_path / "cache", disk_max_bytes=10_000, memory_max_bytes=250)
+    for key in ("a" * 64, "b" * 64, "c" * 64):
+        _put(cache, tmp_path, key, 100)
+
+    # 内存中只保留最近的两条，最早的一条仍可从磁盘读回
+    assert list(cache._memory) == ["b" * 64, "c" * 64]
+    assert cache.get("a" * 64) == b"x" * 100
+    assert list(cache._memory) == ["c" * 64, "a" * 64]
+
+
+def test_phrase_cache_disk_eviction_is_lru(tmp_path):
+    cache = PhraseCache(tmp_path / "cache", disk_max_bytes=250, memory_max_bytes=0)
+    _put(cache, tmp_path, "a" * 64, 100)
+    _put(cache, tmp_path, "b" * 64, 100)
+    assert cache.get("a" * 64) is not None
+    _put(cache, tmp_path, "c" * 64, 100)
+
+    assert cache.get("b" * 64) is None
+    assert not cache.path_for("b" * 64).exists()
+    assert cache.get("a" * 64) is not None
+    assert cache._disk_bytes == 200
+
+
+def test_phrase_cache_reloads_index_and_removes_stale_tmp(tmp_path):
+    cache = PhraseCache(tmp_path / "cache", disk_max_bytes=10_000, memory_max_bytes=0)
+    _put(cache, tmp_path, "a" * 64, 100)
+    stale = cache.tmp_path_for("b" * 64)
+    stale.write_bytes(b"partial")
+
+    reloaded = PhraseCache(tmp_path / "cache", disk_max_bytes=10_000, memory_max_bytes=0)
+    assert reloaded.get("a" * 64) == b"x" * 100
+    assert not stale.exists()
+
+
+async def test_synthesize_timeout_recycles_pool(announcer, monkeypatch):
+    monkeypatch.setattr(speech, "_synthesize_to_file", _hang_synthesize)
+    old_executor = announcer.executor
+    key = PhraseCache.make_key("hang", "", 0)
+
+    start = time.monotonic()
+    assert await announcer._synthesize(key, "hang") is None
+    assert time.monotonic() - start < 10
+
+    assert announcer.executor is not old_executor
+    assert not list(announcer.cache.cache_dir.glob("*/*.tmp"))
+    assert key not in announcer._pending
+    await announcer.cleanup()
+
+
+async def test_queued_synthesis_does_not_time_out(announcer, monkeypatch):
+    # 单个合成进程，三个任务总耗时超过单次超时，但排队时间不应计入超时
+    monkeypatch.setattr(speech, "_synthesize_to_file", _slow_synthesize)
+    old_executor = announcer.executor
+    texts = [f"phrase {index}" for index in range(3)]
+
+    results = await asyncio.gather(*(
+        announcer._synthesize(PhraseCache.make_key(text, "", 0), text) for text in texts
+    ))
+
+    assert results == [text.encode("utf-8") for text in texts]
+    assert announcer.executor is old_executor
+    await announcer.cleanup()
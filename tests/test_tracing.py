@@ -0,0 +1,91 @@
+"""
+链路追踪模块测试
+"""
+import time
+
+import pytest
+
+from tracing import Tracer, create_tracer, span
+
+
+@pytest.fixture
+def make_tracer(make_config):
+    def _make_tracer(sample_rate: float = 1.0, capacity: int = 100) -> Tracer:
+        return Tracer(make_config(f"""
+            [tracing]
+            sample_rate = {sample_rate}
+            capacity = {capacity}
+        """))
+
+    return _make_tracer
+
+
+def _finished_trace(tracer: Tracer, name: str, duration: float, **attrs):
+    """构造一个总耗时为 duration 秒、包含单个阶段的追踪"""
+    start = time.perf_counter() - duration
+    trace = tracer.start(name, start=start, **attrs)
+    trace.add_span("play", start, start + duration / 2)
+    trace.finish()
+    trace.end = start + duration
+    return trace
+
+
+def test_sample_rate_controls_sampling(make_tracer):
+    assert all(make_tracer(sample_rate=1.0).start("hook") is not None for _ in range(50))
+    assert all(make_tracer(sample_rate=0.0).start("hook") is None for _ in range(50))
+
+
+def test_span_records_stage_and_nullcontext_when_unsampled(make_tracer):
+    trace = make_tracer().start("hook", event_type="stop")
+    with span(trace, "parse"):
+        pass
+    with span(None, "parse"):
+        pass
+    trace.finish()
+
+    summary = trace.summary()
+    assert list(summary["stages"]) == ["parse"]
+    assert summary["attrs"] == {"event_type": "stop"}
+    assert summary["duration_ms"] >= summary["stages"]["parse"]
+
+
+def test_slowest_orders_by_duration(make_tracer):
+    tracer = make_tracer()
+    for name, duration in (("fast", 0.01), ("slow", 0.3), ("medium", 0.1)):
+        _finished_trace(tracer, name, duration)
+
+    assert [item["name"] for item in tracer.slowest(2)] == ["slow", "medium"]
+
+
+def test_ring_buffer_keeps_most_recent(make_tracer):
+    tracer = make_tracer(capacity=3)
+    for index in range(5):
+        _finished_trace(tracer, f"hook-{index}", 0.01)
+
+    assert [trace.name for trace in tracer.recent()] == ["hook-2", "hook-3", "hook-4"]
+
+
+def test_export_chrome_trace(make_tracer):
+    tracer = make_tracer()
+    trace = _finished_trace(tracer, "hook", 0.2, event_type="stop")
+
+    exported = tracer.export_chrome_trace()
+    assert exported["displayTimeUnit"] == "ms"
+    meta, event, stage = exported["traceEvents"]
+
+    assert meta["ph"] == "M" and meta["tid"] == trace.trace_id
+    assert meta["args"] == {"name": f"hook #{trace.trace_id}"}
+
+    assert event["ph"] == "X" and event["cat"] == "event"
+    assert event["dur"] == pytest.approx(200_000, abs=1)
+    assert event["args"] == {"event_type": "stop"}
+
+    assert stage["ph"] == "X" and stage["name"] == "play"
+    assert stage["dur"] == pytest.approx(100_000, abs=1)
+    assert stage["ts"] == event["ts"]
+
+
+def test_create_tracer_respects_enabled(make_config):
+    assert create_tracer(make_config("[tracing]\nenabled = false")) is None
+    assert create_tracer(make_config("[server]\nport = 1")) is None
+    assert isinstance(create_tracer(make_config("[tracing]\nenabled = true")), Tracer)
@@ -0,0 +1,170 @@
+"""
+播放链路追踪模块
+按采样率为事件记录各处理阶段的耗时 (trace span)，保存在内存环形缓冲区中，
+支持导出为 Chrome trace-event JSON (chrome://tracing / Perfetto) 和查询最慢的事件
+"""
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional
+
+from dynaconf import Dynaconf
+from loguru import logger
+
+
+# 请求到达时间在 ASGI scope["state"] 中的键名
+RECEIVED_STATE_KEY = "trace_received"
+
+
+class Trace:
+    """单个事件的追踪记录"""
+    __slots__ = ("trace_id", "name", "attrs", "start", "end", "wall_time", "spans", "checkpoint", "_tracer")
+
+    def __init__(self, tracer: "Tracer", trace_id: int, name: str, start: float, attrs: Dict[str, Any]):
+        self._tracer = tracer
+        self.trace_id = trace_id
+        self.name = name
+        self.attrs = attrs
+        self.start = start
+        self.end: Optional[float] = None
+        self.wall_time = time.time() - (time.perf_counter() - start)
+        self.spans: List[tuple] = []
+        # 跨越异步边界的阶段 (如等待后台任务) 由上一段在此记录结束时间，下一段据此补记
+        self.checkpoint = start
+
+    def add_span(self, stage: str, start: float, end: float):
+        """记录一个阶段 (perf_counter 时间戳)，可在任意线程中调用"""
+        self.spans.append((stage, start, end, threading.get_ident()))
+
+    @contextmanager
+    def span(self, stage: str):
+        """以上下文管理器的方式记录一个阶段"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(stage, start, time.perf_counter())
+
+    def finish(self):
+        """结束追踪并放入环形缓冲区"""
+        self.end = time.perf_counter()
+        self._tracer._buffer.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def summary(self) -> Dict[str, Any]:
+        """追踪摘要: 总耗时和各阶段耗时"""
+        stages: Dict[str, float] = {}
+        for stage, start, end, _ in self.spans:
+            stages[stage] = round(stages.get(stage, 0.0) + (end - start) * 1000, 3)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.wall_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "stages": stages,
+            "attrs": self.attrs
+        }
+
+
+def span(trace: Optional[Trace], stage: str):
+    """未采样 (trace 为 None) 时返回空上下文，避免调用方到处判断"""
+    return trace.span(stage) if trace is not None else nullcontext()
+
+
+class Tracer:
+    """追踪器类"""
+
+    def __init__(self, config: Dynaconf):
+        tracing_config = config.tracing
+        self.sample_rate = float(tracing_config.get("sample_rate", 0.1))
+        self._buffer: "deque[Trace]" = deque(maxlen=int(tracing_config.get("capacity", 1000)))
+        self._ids = itertools.count(1)
+        self._epoch = time.perf_counter()
+
+        logger.info(f"链路追踪初始化完成，采样率: {self.sample_rate}, 缓冲区容量: {self._buffer.maxlen}")
+
+    def start(self, name: str, start: Optional[float] = None, **attrs) -> Optional[Trace]:
+        """按采样率开始一个追踪，未采样时返回 None"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        return Trace(
+            self,
+            next(self._ids),
+            name,
+            start if start is not None else time.perf_counter(),
+            attrs
+        )
+
+    def recent(self) -> List[Trace]:
+        """环形缓冲区中的追踪快照"""
+        return list(self._buffer)
+
+    def slowest(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """最慢的若干个事件及其阶段耗时"""
+        traces = sorted(self.recent(), key=lambda trace: trace.duration_ms, reverse=True)
+        return [trace.summary() for trace in traces[:limit]]
+
+    def export_chrome_trace(self) -> Dict[str, Any]:
+        """导出为 Chrome trace-event 格式，每个事件占一行，阶段为其子切片"""
+        events: List[Dict[str, Any]] = []
+        for trace in self.recent():
+            tid = trace.trace_id
+            events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": tid,
+                "args": {"name": f"{trace.name} #{tid}"}
+            })
+            events.append({
+                "name": trace.name,
+                "cat": "event",
+                "ph": "X",
+                "pid": 1,
+                "tid": tid,
+                "ts": self._micros(trace.start),
+                "dur": round(trace.duration_ms * 1000, 1),
+                "args": trace.attrs
+            })
+            for stage, start, end, thread_id in trace.spans:
+                events.append({
+                    "name": stage,
+                    "cat": "stage",
+                    "ph": "X",
+                    "pid": 1,
+                    "tid": tid,
+                    "ts": self._micros(start),
+                    "dur": round((end - start) * 1_000_000, 1),
+                    "args": {"thread": thread_id}
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def _micros(self, timestamp: float) -> float:
+        return round((timestamp - self._epoch) * 1_000_000, 1)
+
+
+class TraceStartMiddleware:
+    """记录请求到达时间的 ASGI 中间件，供处理函数计算请求解析阶段的耗时"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})[RECEIVED_STATE_KEY] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+
+def create_tracer(config: Dynaconf) -> Optional[Tracer]:
+    """根据配置创建追踪器，未启用时返回 None"""
+    tracing_config = config.get("tracing")
+    if not tracing_config or not tracing_config.get("enabled", True):
+        return None
+    return Tracer(config)